@@ -1,26 +1,34 @@
 import argparse
+import shutil
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime
 
 # Update this URL to your server's URL if hosted remotely
 API_URL = "https://demucs.singmesong.com/predict"
 
+# Reuse connections when send_request is called for many files
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
 def send_request(path):
 
-    inputFile = open(path, 'rb')
-    inputData = inputFile.read()
-    inputFile.close()
+    with open(path, 'rb') as inputFile:
+        response = SESSION.post(API_URL, files={"prompt": (None, ""), "content": inputFile}, stream=True)
 
-    response = requests.post(API_URL, files={"prompt": (None, ""), "content": inputData})
-    if response.status_code == 200:
-        filename = "output.wav"
-        
-        with open(filename, "wb") as audio_file:
-            audio_file.write(response.content)
-        
-        print(f"Audio saved to {filename}")
-    else:
-        print(f"Error: Response with status code {response.status_code} - {response.text}")
+    with response:
+        if response.status_code == 200:
+            filename = "output.wav"
+            
+            # Stream the audio to disk instead of holding it all in memory
+            with open(filename, "wb") as audio_file:
+                response.raw.decode_content = True
+                shutil.copyfileobj(response.raw, audio_file, length=1 << 20)
+            
+            print(f"Audio saved to {filename}")
+        else:
+            print(f"Error: Response with status code {response.status_code} - {response.text}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Sends a file to the deep filter net server and receives the enhanced audio")
@@ -1,12 +1,28 @@
 import argparse
+import os
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 # Update this URL to your server's URL if hosted remotely
 API_URL = "http://localhost:8889/predict"
 
-def send_request(input_source, lng, lng_input, is_url=False):
+# Reuse connections across send_request calls
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=20))
+SESSION.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20))
+
+def write_json(filename, data):
+    with open(filename, "w", encoding="utf-8") as json_file:
+        json.dump(data, json_file, ensure_ascii=False, indent=2)
+
+def write_text(filename, text):
+    with open(filename, "w", encoding="utf-8") as text_file:
+        text_file.write(text)
+
+def send_request(input_source, lng, lng_input, is_url=False, output_prefix="transcription"):
     data = {
         "lng": lng,
         "lng_input": lng_input
@@ -14,52 +30,64 @@ def send_request(input_source, lng, lng_input, is_url=False):
 
     if is_url:
         data["url"] = input_source
-        files = None
+        response = SESSION.post(API_URL, data=data)
     else:
+        # Hand requests the open file instead of a bytes copy of it
         with open(input_source, 'rb') as input_file:
-            input_data = input_file.read()
-        files = {"content": ("audio.mp3", input_data)}
-
-    response = requests.post(API_URL, files=files, data=data)
+            files = {"content": ("audio.mp3", input_file, "audio/mpeg")}
+            response = SESSION.post(API_URL, files=files, data=data)
     
     if response.status_code == 200:
         # Generate a unique filename for the output
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
         # Parse the JSON response
-        transcription_data = json.loads(response.text)
+        transcription_data = response.json()
         
-        # Save the full JSON response
-        json_filename = f"transcription_{timestamp}.json"
-        with open(json_filename, "w", encoding="utf-8") as json_file:
-            json.dump(transcription_data, json_file, ensure_ascii=False, indent=2)
+        json_filename = f"{output_prefix}_{timestamp}.json"
+        srt_filename = f"{output_prefix}_{timestamp}.srt"
+        text_filename = f"{output_prefix}_{timestamp}.txt"
+
+        # The three files are independent, write them at the same time
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [
+                executor.submit(write_json, json_filename, transcription_data),
+                executor.submit(write_text, srt_filename, transcription_data["srt"]),
+                executor.submit(write_text, text_filename, transcription_data["text"]),
+            ]
+            for future in futures:
+                future.result()
         print(f"Full transcription data saved to {json_filename}")
-        
-        # Save the SRT content
-        srt_filename = f"transcription_{timestamp}.srt"
-        with open(srt_filename, "w", encoding="utf-8") as srt_file:
-            srt_file.write(transcription_data["srt"])
         print(f"SRT content saved to {srt_filename}")
-        
-        # Save the plain text transcription
-        text_filename = f"transcription_{timestamp}.txt"
-        with open(text_filename, "w", encoding="utf-8") as text_file:
-            text_file.write(transcription_data["text"])
         print(f"Plain text transcription saved to {text_filename}")
         
     else:
         print(f"Error: Response with status code {response.status_code} - {response.text}")
 
+def send_many(paths, lng, lng_input, concurrency=4):
+    """Transcribe several local files at once, sharing the session's connection pool"""
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Prefix outputs with the input's position too, so a/x.mp3 and b/x.mp3 can't overwrite each other
+        futures = [
+            executor.submit(send_request, path, lng, lng_input, False, f"{index}_{os.path.splitext(os.path.basename(path))[0]}")
+            for index, path in enumerate(paths)
+        ]
+        for future in futures:
+            future.result()
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Sends an audio file or URL to the Whisper Hallu server and saves the transcription")
     group = parser.add_mutually_exclusive_group(required=True)
-    group.add_argument("--path", help="Path of the audio file to transcribe")
+    group.add_argument("--path", nargs="+", help="Path of the audio file(s) to transcribe")
     group.add_argument("--url", help="URL of the audio file to transcribe")
     parser.add_argument("--lng", default="en", help="Language for transcription output (default: en)")
     parser.add_argument("--lng_input", default="en", help="Language of the input audio (default: en)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of files sent at the same time when several paths are given (default: 4)")
     args = parser.parse_args()
     
     if args.url:
         send_request(args.url, args.lng, args.lng_input, is_url=True)
+    elif len(args.path) == 1:
+        send_request(args.path[0], args.lng, args.lng_input, is_url=False)
     else:
-        send_request(args.path, args.lng, args.lng_input, is_url=False)
\ No newline at end of file
+        send_many(args.path, args.lng, args.lng_input, concurrency=args.concurrency)
\ No newline at end of file
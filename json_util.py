@@ -1,4 +1,9 @@
-import json
+import re
+
+# Phrases Whisper hallucinates from YouTube outros, matched case-insensitively
+WEIRD_WORDS = ["Hãy đăng ký kênh", "subscribe cho", "Ghiền Mì Gõ"]
+_WEIRD_RE = re.compile("|".join(re.escape(word) for word in WEIRD_WORDS), re.IGNORECASE)
+
 
 def _get_utterances(gladia_response, is_translation_empty):
     """Helper function to extract utterances from the response"""
@@ -9,21 +14,15 @@ def _get_utterances(gladia_response, is_translation_empty):
 
 def _create_json_segment(utterance):
     """Helper function to create a JSON segment from an utterance"""
-    json_segment = {
+    return {
         "start": utterance.get("start", 0),
         "end": utterance.get("end", 0),
         "sentence": utterance.get("text", "").strip(),
-        "words": []
+        "words": [
+            {"start": word.get("start", 0), "end": word.get("end", 0), "text": word.get("word", "").strip()}
+            for word in utterance.get("words", [])
+        ]
     }
-    
-    for word in utterance.get("words", []):
-        json_segment["words"].append({
-            "start": word.get("start", 0),
-            "end": word.get("end", 0),
-            "text": word.get("word", "").strip()
-        })
-    
-    return json_segment
 
 def _get_text_and_srt(gladia_response, is_translation_empty):
     """Helper function to extract text and srt from the response"""
@@ -62,38 +61,36 @@ def convert_gladia_to_internal_format(gladia_response):
     return result
 
 def split_sentence(sentence, words):
-    parts = [part.strip() for part in sentence.replace('.', ',').split(',') if part.strip()]
+    # Work out each word's text and whether it ends a clause once, up front
+    texts = [word['text'] for word in words]
+    is_boundary = [text.strip().endswith((',', '.')) for text in texts]
     new_sentences = []
-    current_words = []
-    current_part = []
+    segment_start = 0
     
-    for word in words:
-        current_words.append(word)
-        current_part.append(word['text'])
-        
-        if (word['text'].strip().endswith(',') or word['text'].strip().endswith('.')) and len(current_part) >= 3:
+    for i in range(len(words)):
+        if is_boundary[i] and i + 1 - segment_start >= 3:
             new_sentence = {
-                'start': current_words[0]['start'],
-                'end': current_words[-1]['end'],
-                'sentence': ' '.join(w['text'] for w in current_words).strip(),
-                'words': current_words
+                'start': words[segment_start]['start'],
+                'end': words[i]['end'],
+                'sentence': ' '.join(texts[segment_start:i + 1]).strip(),
+                'words': words[segment_start:i + 1]
             }
             new_sentences.append(new_sentence)
-            current_words = []
-            current_part = []
+            segment_start = i + 1
     
+    current_words = words[segment_start:]
     if current_words:
         if new_sentences and len(current_words) < 3:
             # Append short remaining part to the last sentence
             last_sentence = new_sentences[-1]
             last_sentence['end'] = current_words[-1]['end']
-            last_sentence['sentence'] += ' ' + ' '.join(w['text'] for w in current_words)
+            last_sentence['sentence'] += ' ' + ' '.join(texts[segment_start:])
             last_sentence['words'].extend(current_words)
         else:
             new_sentence = {
                 'start': current_words[0]['start'],
                 'end': current_words[-1]['end'],
-                'sentence': ' '.join(w['text'] for w in current_words).strip(),
+                'sentence': ' '.join(texts[segment_start:]).strip(),
                 'words': current_words
             }
             new_sentences.append(new_sentence)
@@ -101,8 +98,7 @@ def split_sentence(sentence, words):
     return new_sentences
 
 def contains_weird_words(text):
-    weird_words = ["Hãy đăng ký kênh", "subscribe cho", "Ghiền Mì Gõ"]
-    return any(word.lower() in text.lower() for word in weird_words)
+    return _WEIRD_RE.search(text) is not None
 
 def process_json(input_json):
     output_json = []
@@ -1,5 +1,5 @@
 import unittest
-from json_util import convert_gladia_to_internal_format
+from json_util import convert_gladia_to_internal_format, split_sentence, process_json
 
 class TestConvertGladiaToInternalFormat(unittest.TestCase):
     def test_convert_gladia_to_internal_format(self):
@@ -66,5 +66,50 @@ class TestConvertGladiaToInternalFormat(unittest.TestCase):
         # Assert the result
         self.assertEqual(result, expected_output)
 
+def _words(*texts):
+    return [{"start": float(i), "end": i + 0.5, "text": text} for i, text in enumerate(texts)]
+
+class TestSplitSentence(unittest.TestCase):
+    def test_splits_at_clause_boundaries(self):
+        words = _words("Hello", "there", "friend,", "how", "are", "you", "today.")
+
+        result = split_sentence("Hello there friend, how are you today.", words)
+
+        self.assertEqual(result, [
+            {"start": 0.0, "end": 2.5, "sentence": "Hello there friend,", "words": words[0:3]},
+            {"start": 3.0, "end": 6.5, "sentence": "how are you today.", "words": words[3:7]}
+        ])
+
+    def test_short_boundary_does_not_split(self):
+        words = _words("Yes,", "I", "think", "so.")
+
+        result = split_sentence("Yes, I think so.", words)
+
+        self.assertEqual(result, [
+            {"start": 0.0, "end": 3.5, "sentence": "Yes, I think so.", "words": words}
+        ])
+
+    def test_short_tail_merges_into_previous_sentence(self):
+        words = _words("One", "two", "three.", "four")
+
+        result = split_sentence("One two three. four", words)
+
+        self.assertEqual(result, [
+            {"start": 0.0, "end": 3.5, "sentence": "One two three. four", "words": words}
+        ])
+
+class TestProcessJson(unittest.TestCase):
+    def test_weird_words_are_cleared(self):
+        items = [
+            {"start": 0.0, "end": 1.0, "sentence": "HÃY ĐĂNG KÝ KÊNH nhé", "words": _words("HÃY", "ĐĂNG", "KÝ", "KÊNH", "nhé")},
+            {"start": 1.0, "end": 2.0, "sentence": "Xin chào", "words": _words("Xin", "chào")}
+        ]
+
+        result = process_json(items)
+
+        self.assertEqual(result[0]["sentence"], "")
+        self.assertEqual(result[0]["words"], [])
+        self.assertEqual(result[1]["sentence"], "Xin chào")
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,27 @@
+import glob
+import os
+import tempfile
+import time
+
+# Outputs older than this were left behind by responses that were never sent
+OUTPUT_MAX_AGE = 3600
+
+def new_output_path(prefix, suffix):
+    """Return a new temporary file for a response body, sweeping stale outputs with the same prefix first.
+
+    encode_response removes an output once it has been sent, but LitServe
+    drops the response of a request that timed out, so nothing removes it.
+    """
+    sweep_outputs(prefix)
+    with tempfile.NamedTemporaryFile(delete=False, prefix=prefix, suffix=suffix) as output:
+        return output.name
+
+def sweep_outputs(prefix, max_age=OUTPUT_MAX_AGE):
+    cutoff = time.time() - max_age
+    for path in glob.glob(os.path.join(glob.escape(tempfile.gettempdir()), glob.escape(prefix) + "*")):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            # Already removed by another worker
+            pass
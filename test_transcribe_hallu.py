@@ -1,12 +1,16 @@
 import unittest
 from unittest.mock import patch
 import json
-from transcribeHallu import transcribe_with_gladia
+import os
+import subprocess
+import tempfile
+import wave
+from transcribeHallu import transcribe_with_gladia, getWavDuration, getProbeDuration
 
 class TestTranscribeWithGladia(unittest.TestCase):
 
-    @patch('transcribeHallu.requests.post')
-    @patch('transcribeHallu.requests.get')
+    @patch('transcribeHallu.GLADIA_SESSION.post')
+    @patch('transcribeHallu.GLADIA_SESSION.get')
     def test_successful_transcription(self, mock_get, mock_post):
         # Mock the API responses
         mock_post.side_effect = [
@@ -27,7 +31,7 @@ class TestTranscribeWithGladia(unittest.TestCase):
         self.assertIn("json", result_dict)
         self.assertEqual(result_dict["text"], "Test translation")
 
-    @patch('transcribeHallu.requests.post')
+    @patch('transcribeHallu.GLADIA_SESSION.post')
     def test_upload_failure(self, mock_post):
         mock_post.return_value = unittest.mock.Mock(status_code=400, text="Upload failed")
 
@@ -38,6 +42,55 @@ class TestTranscribeWithGladia(unittest.TestCase):
 
     # Add more test cases for different scenarios
 
+class TestDuration(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.work_dir.cleanup)
+
+    def write_wav(self, name, seconds, framerate=16000):
+        path = os.path.join(self.work_dir.name, name)
+        with wave.open(path, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(framerate)
+            w.writeframes(b"\x00\x00" * framerate * seconds)
+        return path
+
+    def test_wav_duration_from_header(self):
+        self.assertEqual(getWavDuration(self.write_wav("two_seconds.wav", 2)), 2)
+
+    def test_wav_duration_truncated_file(self):
+        path = self.write_wav("truncated.wav", 2)
+        with open(path, "r+b") as f:
+            f.truncate(20)
+        self.assertIsNone(getWavDuration(path))
+
+    def test_wav_duration_not_a_wav(self):
+        path = os.path.join(self.work_dir.name, "audio.mp3")
+        with open(path, "wb") as f:
+            f.write(b"ID3\x04\x00\x00\x00\x00\x00\x00not a wav file")
+        self.assertIsNone(getWavDuration(path))
+
+    def test_wav_duration_missing_file(self):
+        self.assertIsNone(getWavDuration(os.path.join(self.work_dir.name, "missing.wav")))
+
+    @patch('transcribeHallu.subprocess.check_output', return_value=b"125.72\n")
+    def test_probe_duration(self, mock_check_output):
+        self.assertEqual(getProbeDuration("audio.mp3"), 125)
+        args = mock_check_output.call_args[0][0]
+        self.assertEqual(args[0], "ffprobe")
+        self.assertIn("format=duration", args)
+        self.assertEqual(args[-1], "audio.mp3")
+
+    @patch('transcribeHallu.subprocess.check_output', side_effect=subprocess.CalledProcessError(1, "ffprobe"))
+    def test_probe_duration_ffprobe_error(self, mock_check_output):
+        self.assertIsNone(getProbeDuration("audio.mp3"))
+
+    @patch('transcribeHallu.subprocess.check_output', return_value=b"N/A\n")
+    def test_probe_duration_unknown(self, mock_check_output):
+        self.assertIsNone(getProbeDuration("audio.mp3"))
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -2,7 +2,11 @@ import unittest
 from unittest.mock import patch, MagicMock
 import tempfile
 import os
+import io
+import subprocess
+import asyncio
 from fastapi import HTTPException
+from fastapi.responses import FileResponse
 from video_audio_merge_server import VideoAudioMergeAPI
 
 class TestVideoAudioMergeAPI(unittest.TestCase):
@@ -10,24 +14,39 @@ class TestVideoAudioMergeAPI(unittest.TestCase):
     def setUp(self):
         self.api = VideoAudioMergeAPI()
 
+    @patch('url_util.socket.getaddrinfo', return_value=[(None, None, None, "", ("93.184.216.34", 80))])
     @patch('video_audio_merge_server.tempfile.NamedTemporaryFile')
-    @patch('video_audio_merge_server.urllib.request.urlretrieve')
-    def test_decode_request_success(self, mock_urlretrieve, mock_temp_file):
+    @patch('video_audio_merge_server.DOWNLOAD_SESSION.head')
+    @patch('video_audio_merge_server.DOWNLOAD_SESSION.get')
+    def test_decode_request_success(self, mock_get, mock_head, mock_temp_file, mock_getaddrinfo):
         # Mock request data
         mock_request = {
-            "video": MagicMock(file=MagicMock(read=lambda: b"video_content")),
+            "video": MagicMock(file=io.BytesIO(b"video_content")),
             "audio_url": "http://example.com/audio.mp3"
         }
 
-        # Mock temporary files
+        # Mock temporary file
         mock_video_temp = MagicMock(name='/tmp/video.mp4')
-        mock_audio_temp = MagicMock(name='/tmp/audio.mp3')
-        mock_temp_file.side_effect = [mock_video_temp, mock_audio_temp]
+        mock_temp_file.return_value = mock_video_temp
+        mock_head.return_value = MagicMock(ok=True, is_redirect=False, headers={"Content-Type": "audio/mpeg", "Content-Length": "1024"})
 
         result = self.api.decode_request(mock_request)
 
-        self.assertEqual(result, (mock_video_temp.name, mock_audio_temp.name))
-        mock_urlretrieve.assert_called_once_with("http://example.com/audio.mp3", mock_audio_temp.name)
+        # The audio URL is passed on for ffmpeg to read, nothing is downloaded here
+        self.assertEqual(result, (mock_video_temp.name, "http://example.com/audio.mp3"))
+        mock_head.assert_called_once_with("http://example.com/audio.mp3", allow_redirects=False, timeout=3)
+        mock_get.assert_not_called()
+        mock_video_temp.write.assert_called_once_with(b"video_content")
+
+    def test_decode_request_audio_url_not_http(self):
+        mock_request = {
+            "video": MagicMock(file=io.BytesIO(b"video_content")),
+            "audio_url": "/etc/passwd"
+        }
+        with self.assertRaises(HTTPException) as context:
+            self.api.decode_request(mock_request)
+        self.assertEqual(context.exception.status_code, 400)
+        self.assertEqual(context.exception.detail, "Only http and https URLs are supported.")
 
     def test_decode_request_no_video(self):
         mock_request = {"audio_url": "http://example.com/audio.mp3"}
@@ -37,7 +56,7 @@ class TestVideoAudioMergeAPI(unittest.TestCase):
         self.assertEqual(context.exception.detail, "No video file found in the request.")
 
     def test_decode_request_no_audio_url(self):
-        mock_request = {"video": MagicMock(file=MagicMock(read=lambda: b"video_content"))}
+        mock_request = {"video": MagicMock(file=io.BytesIO(b"video_content"))}
         with self.assertRaises(HTTPException) as context:
             self.api.decode_request(mock_request)
         self.assertEqual(context.exception.status_code, 400)
@@ -69,6 +88,57 @@ class TestVideoAudioMergeAPI(unittest.TestCase):
             self.assertEqual(context.exception.status_code, 500)
             self.assertTrue("FFmpeg error" in context.exception.detail)
 
+    @patch('video_audio_merge_server.subprocess.run')
+    def test_predict_sweeps_stale_outputs(self, mock_run):
+        mock_run.return_value = MagicMock(returncode=0)
+        stale = tempfile.NamedTemporaryFile(prefix="merge_output_", suffix=".mp4", delete=False)
+        stale.close()
+        os.utime(stale.name, (0, 0))
+        recent = tempfile.NamedTemporaryFile(prefix="merge_output_", suffix=".mp4", delete=False)
+        recent.close()
+        video_temp = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
+        video_temp.close()
+
+        result = self.api.predict((video_temp.name, "http://example.com/audio.mp3"))
+
+        # Outputs of responses that were never sent are removed, ones that may still be on their way are not
+        self.assertFalse(os.path.exists(stale.name))
+        self.assertTrue(os.path.exists(recent.name))
+        os.unlink(recent.name)
+        os.unlink(result)
+
+    @patch('video_audio_merge_server.download_to')
+    @patch('video_audio_merge_server.subprocess.run')
+    def test_predict_falls_back_to_download_when_audio_url_fails(self, mock_run, mock_download):
+        mock_run.side_effect = [
+            subprocess.CalledProcessError(1, 'ffmpeg', stderr=b"http://example.com/audio.mp3: Server returned 403 Forbidden"),
+            MagicMock(returncode=0)
+        ]
+        video_temp = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
+        video_temp.close()
+
+        result = self.api.predict((video_temp.name, "http://example.com/audio.mp3"))
+
+        self.assertTrue(result.endswith('.mp4'))
+        mock_download.assert_called_once()
+        self.assertEqual(mock_run.call_count, 2)
+        os.unlink(result)
+
+    @patch('video_audio_merge_server.download_to')
+    @patch('video_audio_merge_server.subprocess.run')
+    def test_predict_does_not_download_on_video_error(self, mock_run, mock_download):
+        mock_run.side_effect = subprocess.CalledProcessError(1, 'ffmpeg', stderr=b"/tmp/video.mp4: Invalid data found when processing input")
+        video_temp = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
+        video_temp.close()
+
+        with self.assertRaises(HTTPException) as context:
+            self.api.predict((video_temp.name, "http://example.com/audio.mp3"))
+
+        self.assertEqual(context.exception.status_code, 500)
+        self.assertIn("Invalid data found when processing input", context.exception.detail)
+        mock_download.assert_not_called()
+        os.unlink(video_temp.name)
+
     def test_encode_response_success(self):
         with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_file:
             temp_file.write(b"test content")
@@ -76,8 +146,12 @@ class TestVideoAudioMergeAPI(unittest.TestCase):
             
             response = self.api.encode_response(temp_file.name)
             
-            self.assertEqual(response.body, b"test content")
+            self.assertIsInstance(response, FileResponse)
+            self.assertEqual(response.path, temp_file.name)
             self.assertEqual(response.media_type, "video/mp4")
+            # The file is only removed once the response has been sent
+            self.assertTrue(os.path.exists(temp_file.name))
+            asyncio.run(response.background())
             self.assertFalse(os.path.exists(temp_file.name))
 
     def test_encode_response_file_not_found(self):
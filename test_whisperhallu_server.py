@@ -0,0 +1,199 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from collections import OrderedDict
+import io
+import os
+import tempfile
+import ffmpeg
+from fastapi import HTTPException
+import whisperhallu_server
+from whisperhallu_server import WhisperHalluAPI, convert_to_wav
+
+TRANSCRIPTION = '{"text": "hello", "srt": "", "json": []}'
+CONVERTED = ("/tmp/whisperhallu_test/input.wav", "/tmp/whisperhallu_test")
+
+def resolve_to(address):
+    return [(None, None, None, "", (address, 80))]
+
+class TestWhisperHalluAPI(unittest.TestCase):
+
+    def setUp(self):
+        self.api = WhisperHalluAPI()
+        self.api.session = MagicMock()
+        self.api.transcription_cache = OrderedDict()
+        self.set_head({"ETag": '"v1"', "Content-Type": "audio/mpeg", "Content-Length": "1024"})
+        getaddrinfo = patch('url_util.socket.getaddrinfo', return_value=resolve_to("93.184.216.34"))
+        self.mock_getaddrinfo = getaddrinfo.start()
+        self.addCleanup(getaddrinfo.stop)
+
+    def set_head(self, headers):
+        self.api.session.head.return_value = MagicMock(ok=True, is_redirect=False, headers=headers)
+
+    def transcribe(self, url, lng_input="en"):
+        request_data = self.api.decode_request({"url": url, "lng_input": lng_input})
+        return self.api.predict(request_data)
+
+    @patch('whisperhallu_server.remove_work_dir')
+    @patch('whisperhallu_server.transcribePrompt', return_value=TRANSCRIPTION)
+    @patch('whisperhallu_server.convert_to_wav', return_value=CONVERTED)
+    def test_cache_hit_skips_transcription(self, mock_convert, mock_transcribe, mock_remove):
+        self.assertEqual(self.transcribe("http://example.com/a.mp3"), TRANSCRIPTION)
+        self.assertEqual(self.transcribe("http://example.com/a.mp3"), TRANSCRIPTION)
+
+        mock_convert.assert_called_once_with("http://example.com/a.mp3")
+        mock_transcribe.assert_called_once()
+        self.assertIn(("http://example.com/a.mp3", '"v1"', "en"), self.api.transcription_cache)
+
+    @patch('whisperhallu_server.remove_work_dir')
+    @patch('whisperhallu_server.transcribePrompt', return_value=TRANSCRIPTION)
+    @patch('whisperhallu_server.convert_to_wav', return_value=CONVERTED)
+    def test_no_validator_is_not_cached(self, mock_convert, mock_transcribe, mock_remove):
+        self.set_head({"Content-Type": "audio/mpeg"})
+
+        self.transcribe("http://example.com/a.mp3")
+        self.transcribe("http://example.com/a.mp3")
+
+        self.assertEqual(mock_transcribe.call_count, 2)
+        self.assertEqual(len(self.api.transcription_cache), 0)
+
+    @patch('whisperhallu_server.remove_work_dir')
+    @patch('whisperhallu_server.transcribePrompt', return_value=TRANSCRIPTION)
+    @patch('whisperhallu_server.convert_to_wav', return_value=CONVERTED)
+    def test_other_input_language_misses_cache(self, mock_convert, mock_transcribe, mock_remove):
+        self.transcribe("http://example.com/a.mp3", lng_input="en")
+        self.transcribe("http://example.com/a.mp3", lng_input="vi")
+
+        self.assertEqual(mock_transcribe.call_count, 2)
+        self.assertEqual(len(self.api.transcription_cache), 2)
+
+    @patch('whisperhallu_server.TRANSCRIPTION_CACHE_SIZE', 2)
+    @patch('whisperhallu_server.remove_work_dir')
+    @patch('whisperhallu_server.transcribePrompt', return_value=TRANSCRIPTION)
+    @patch('whisperhallu_server.convert_to_wav', return_value=CONVERTED)
+    def test_cache_evicts_least_recently_used(self, mock_convert, mock_transcribe, mock_remove):
+        self.transcribe("http://example.com/a.mp3")
+        self.transcribe("http://example.com/b.mp3")
+        # Using a again makes b the least recently used entry
+        self.transcribe("http://example.com/a.mp3")
+        self.transcribe("http://example.com/c.mp3")
+
+        self.assertEqual(mock_transcribe.call_count, 3)
+        self.assertEqual(
+            [key[0] for key in self.api.transcription_cache],
+            ["http://example.com/a.mp3", "http://example.com/c.mp3"]
+        )
+
+    @patch('whisperhallu_server.remove_work_dir')
+    @patch('whisperhallu_server.transcribePrompt', return_value="[Too long (7200s)]")
+    @patch('whisperhallu_server.convert_to_wav', return_value=CONVERTED)
+    def test_too_long_audio_is_rejected_and_not_cached(self, mock_convert, mock_transcribe, mock_remove):
+        with self.assertRaises(HTTPException) as context:
+            self.transcribe("http://example.com/a.mp3")
+        self.assertEqual(context.exception.status_code, 413)
+        self.assertEqual(len(self.api.transcription_cache), 0)
+        mock_remove.assert_called_once_with("/tmp/whisperhallu_test")
+
+    def test_check_url_rejects_other_schemes(self):
+        with self.assertRaises(HTTPException) as context:
+            self.api.decode_request({"url": "file:///etc/passwd"})
+        self.assertEqual(context.exception.status_code, 400)
+        self.api.session.head.assert_not_called()
+
+    def test_check_url_rejects_large_files(self):
+        self.set_head({"Content-Type": "audio/mpeg", "Content-Length": str(whisperhallu_server.MAX_AUDIO_BYTES + 1)})
+        with self.assertRaises(HTTPException) as context:
+            self.api.decode_request({"url": "http://example.com/a.mp3"})
+        self.assertEqual(context.exception.status_code, 413)
+
+    def test_check_url_rejects_non_audio_content(self):
+        self.set_head({"Content-Type": "text/html"})
+        with self.assertRaises(HTTPException) as context:
+            self.api.decode_request({"url": "http://example.com/page"})
+        self.assertEqual(context.exception.status_code, 400)
+
+    def test_check_url_rejects_private_hosts(self):
+        self.mock_getaddrinfo.return_value = resolve_to("10.0.0.5")
+        with self.assertRaises(HTTPException) as context:
+            self.api.decode_request({"url": "http://internal.example.com/a.mp3"})
+        self.assertEqual(context.exception.status_code, 400)
+        self.api.session.head.assert_not_called()
+
+    def test_check_url_rejects_redirect_to_private_host(self):
+        self.api.session.head.side_effect = [
+            MagicMock(is_redirect=True, headers={"Location": "http://169.254.169.254/latest/meta-data"}),
+        ]
+        self.mock_getaddrinfo.side_effect = [resolve_to("93.184.216.34"), resolve_to("169.254.169.254")]
+        with self.assertRaises(HTTPException) as context:
+            self.api.decode_request({"url": "http://example.com/a.mp3"})
+        self.assertEqual(context.exception.status_code, 400)
+        self.api.session.head.assert_called_once_with("http://example.com/a.mp3", allow_redirects=False, timeout=3)
+
+    @patch('whisperhallu_server.remove_work_dir')
+    @patch('whisperhallu_server.transcribePrompt', return_value=TRANSCRIPTION)
+    @patch('whisperhallu_server.convert_to_wav', return_value=CONVERTED)
+    def test_redirects_are_followed_to_the_final_url(self, mock_convert, mock_transcribe, mock_remove):
+        self.api.session.head.side_effect = [
+            MagicMock(is_redirect=True, headers={"Location": "/files/a.mp3"}),
+            MagicMock(ok=True, is_redirect=False, headers={"Content-Type": "audio/mpeg"}),
+        ]
+        self.transcribe("http://example.com/a.mp3")
+
+        mock_convert.assert_called_once_with("http://example.com/files/a.mp3")
+
+    @patch('whisperhallu_server.convert_to_wav')
+    def test_url_read_error_falls_back_to_download(self, mock_convert):
+        mock_convert.side_effect = [
+            ffmpeg.Error("ffmpeg", None, b"http://example.com/a.mp3: Server returned 403 Forbidden"),
+            CONVERTED
+        ]
+        self.api.session.get.return_value.__enter__.return_value = MagicMock(is_redirect=False)
+
+        request_data = self.api.decode_request({"url": "http://example.com/a.mp3"})
+
+        self.assertEqual(request_data["file_path"], "/tmp/whisperhallu_test/input.wav")
+        self.assertEqual(request_data["work_dir"], "/tmp/whisperhallu_test")
+        self.api.session.get.assert_called_once()
+        self.assertEqual(mock_convert.call_args[0][0], "pipe:0")
+
+    @patch('whisperhallu_server.convert_to_wav')
+    def test_decode_error_does_not_download(self, mock_convert):
+        mock_convert.side_effect = ffmpeg.Error("ffmpeg", None, b"Invalid data found when processing input")
+        with self.assertRaises(HTTPException) as context:
+            self.api.decode_request({"url": "http://example.com/a.mp3"})
+        self.assertEqual(context.exception.status_code, 400)
+        self.api.session.get.assert_not_called()
+
+    @patch('whisperhallu_server.convert_to_wav')
+    def test_timeout_does_not_download(self, mock_convert):
+        mock_convert.side_effect = ffmpeg.Error("ffmpeg", None, b"ffmpeg did not finish within 300 seconds")
+        with self.assertRaises(HTTPException) as context:
+            self.api.decode_request({"url": "http://example.com/a.mp3"})
+        self.assertEqual(context.exception.status_code, 400)
+        self.api.session.get.assert_not_called()
+
+    @patch('whisperhallu_server.subprocess.Popen')
+    def test_convert_to_wav_failure_removes_work_dir(self, mock_popen):
+        work_dir = tempfile.mkdtemp()
+        mock_popen.return_value = MagicMock(returncode=1)
+
+        with patch('whisperhallu_server.tempfile.mkdtemp', return_value=work_dir):
+            with self.assertRaises(ffmpeg.Error):
+                convert_to_wav("http://example.com/a.mp3")
+
+        self.assertFalse(os.path.exists(work_dir))
+        args = mock_popen.call_args[0][0]
+        self.assertIn("-rw_timeout", args)
+        mock_popen.return_value.communicate.assert_called_once_with(timeout=whisperhallu_server.CONVERT_TIMEOUT)
+
+    @patch('whisperhallu_server.subprocess.Popen', side_effect=FileNotFoundError("ffmpeg"))
+    def test_convert_to_wav_start_failure_is_an_ffmpeg_error(self, mock_popen):
+        work_dir = tempfile.mkdtemp()
+
+        with patch('whisperhallu_server.tempfile.mkdtemp', return_value=work_dir):
+            with self.assertRaises(ffmpeg.Error):
+                convert_to_wav("pipe:0", io.BytesIO(b"audio"))
+
+        self.assertFalse(os.path.exists(work_dir))
+
+if __name__ == '__main__':
+    unittest.main()
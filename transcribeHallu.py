@@ -2,6 +2,8 @@ import sys
 import os
 import time
 import re
+import wave
+import subprocess
 from _io import StringIO
 import json
 from json_util import split_transcription, convert_gladia_to_internal_format
@@ -127,7 +129,8 @@ def loadModel(gpu: str,modelSize=None):
             else:
                 modelPath = "whisper-medium-ct2/"
             logger.info(f"Loading model: {modelPath} GPU: {gpu} BS: {beam_size} PTC: {patience} TEMP: {temperature}")
-            compute_type="float16"# float16 int8_float16 int8
+            #int8 weights halve VRAM and speed up decoding, activations stay in float16 on GPU
+            compute_type="int8_float16" if device == "cuda" else "int8"# float16 int8_float16 int8
             model = WhisperModel(modelPath, device=device,device_index=int(gpu), compute_type=compute_type)
         elif whisperFound == "STD":
             if(modelSize == None):
@@ -168,48 +171,59 @@ def getDuration(aLog:str):
         return sum(x * int(t) for x, t in zip([3600, 60, 1], time.split(":")))
     return None
 
+def getWavDuration(aPath:str):
+    #Read the duration from the WAV header, no need to decode the whole file with ffmpeg
+    try:
+        with wave.open(aPath, "rb") as w:
+            return int(w.getnframes() / w.getframerate())
+    except (wave.Error, EOFError, OSError, ZeroDivisionError):
+        return None
+
+def getProbeDuration(aPath:str):
+    #Ask ffprobe for the container duration only, no stream parsing or decoding
+    try:
+        out = subprocess.check_output(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", aPath], timeout=10)
+        return int(float(out.strip()))
+    except (subprocess.SubprocessError, OSError, ValueError):
+        return None
+
 def formatTimeStamp(aT=0):
     aH = int(aT/3600)
     aM = int((aT%3600)/60)
     aS = (aT%60)
     return "%02d:%02d:%06.3f" % (aH,aM,aS)
 
+#Marker prompts per language, built once at import
+PROMPTS = {
+    "en": "Whisper, Ok. "\
+        +"A pertinent sentence for your purpose in your language. "\
+        +"Ok, Whisper. Whisper, Ok. Ok, Whisper. Whisper, Ok. "\
+        +"Please find here, an unlikely ordinary sentence. "\
+        +"This is to avoid a repetition to be deleted. "\
+        +"Ok, Whisper. ",
+    "fr": "Whisper, Ok. "\
+        +"Une phrase pertinente pour votre propos dans votre langue. "\
+        +"Ok, Whisper. Whisper, Ok. Ok, Whisper. Whisper, Ok. "\
+        +"Merci de trouver ci-joint, une phrase ordinaire improbable. "\
+        +"Pour éviter une répétition à être supprimée. "\
+        +"Ok, Whisper. ",
+    "uk": "Whisper, Ok. "\
+        +"Доречне речення вашою мовою для вашої мети. "\
+        +"Ok, Whisper. Whisper, Ok. Ok, Whisper. Whisper, Ok. "\
+        +"Будь ласка, знайдіть тут навряд чи звичайне речення. "\
+        +"Це зроблено для того, щоб уникнути повторення, яке потрібно видалити. "\
+        +"Ok, Whisper. ",
+    "hi": "विस्पर, ओके. "\
+        +"आपकी भाषा में आपके उद्देश्य के लिए एक प्रासंगिक वाक्य। "\
+        +"ओके, विस्पर. विस्पर, ओके. ओके, विस्पर. विस्पर, ओके. "\
+        +"कृपया यहां खोजें, एक असंभावित सामान्य वाक्य। "\
+        +"यह हटाए जाने की पुनरावृत्ति से ��चने के लिए है। "\
+        +"ओके, विस्पर. ",
+}
+
 def getPrompt(lng:str):
-    if(lng == "en"):
-        aOk=""
-        return "Whisper, Ok. "\
-            +"A pertinent sentence for your purpose in your language. "\
-            +"Ok, Whisper. Whisper, Ok. Ok, Whisper. Whisper, Ok. "\
-            +"Please find here, an unlikely ordinary sentence. "\
-            +"This is to avoid a repetition to be deleted. "\
-            +"Ok, Whisper. "
-    
-    if(lng == "fr"):
-        return "Whisper, Ok. "\
-            +"Une phrase pertinente pour votre propos dans votre langue. "\
-            +"Ok, Whisper. Whisper, Ok. Ok, Whisper. Whisper, Ok. "\
-            +"Merci de trouver ci-joint, une phrase ordinaire improbable. "\
-            +"Pour éviter une répétition à être supprimée. "\
-            +"Ok, Whisper. "
-    
-    if(lng == "uk"):
-        return "Whisper, Ok. "\
-            +"Доречне речення вашою мовою для вашої мети. "\
-            +"Ok, Whisper. Whisper, Ok. Ok, Whisper. Whisper, Ok. "\
-            +"Будь ласка, знайдіть тут навряд чи звичайне речення. "\
-            +"Це зроблено для того, щоб уникнути повторення, яке потрібно видалити. "\
-            +"Ok, Whisper. "
-    
-    if(lng == "hi"):
-        return "विस्पर, ओके. "\
-            +"आपकी भाषा में आपके उद्देश्य के लिए एक प्रासंगिक वाक्य। "\
-            +"ओके, विस्पर. विस्पर, ओके. ओके, विस्पर. विस्पर, ओके. "\
-            +"कृपया यहां खोजें, एक असंभावित सामान्य वाक्य। "\
-            +"यह हटाए जाने की पुनरावृत्ति से ��चने के लिए है। "\
-            +"ओके, विस्पर. "
-    
-    #Not Already defined?
-    return ""
+    #Not Already defined? -> ""
+    return PROMPTS.get(lng, "")
 
 def transcribePrompt(path: str, lng: str, prompt=None, lngInput=None, isMusic=False, addSRT=False, truncDuration=TRUNC_DURATION, maxDuration=MAX_DURATION):
     """Whisper transcribe with language detection and Gladia API for non-English."""
@@ -224,11 +238,11 @@ def transcribePrompt(path: str, lng: str, prompt=None, lngInput=None, isMusic=Fa
         else:
             prompt = ""
     
-    logger.info("=====transcribePrompt=====")
-    logger.info(f"PATH: {path}")
-    logger.info(f"LNGINPUT: {lngInput}")
-    logger.info(f"LNG: {lng}")
-    logger.info(f"PROMPT: {prompt}")
+    logger.debug("=====transcribePrompt=====")
+    logger.debug("PATH: %s", path)
+    logger.debug("LNGINPUT: %s", lngInput)
+    logger.debug("LNG: %s", lng)
+    logger.debug("PROMPT: %s", prompt)
     
     opts = dict(language=lng, initial_prompt=prompt, word_timestamps=True)
     return transcribeOpts(path, opts, lngInput, lng, isMusic=isMusic, addSRT=addSRT, subEnd=truncDuration, maxDuration=maxDuration)
@@ -249,12 +263,12 @@ def transcribeOpts(path: str, opts: dict, lngInput=None, lng=None, isMusic=False
         #Convert to WAV to avoid later possible decoding problem
         pathWAV = pathIn+".WAV"+".wav"
         aCmd = "ffmpeg -y"+" -i \""+pathIn+"\""+" -ss "+subBeg+" -to "+subEnd + " -c:a pcm_s16le -ar "+str(SAMPLING_RATE)+" \""+pathWAV+"\" > \""+pathWAV+".log\" 2>&1"
-        logger.info(f"CMD: {aCmd}")
+        logger.debug("CMD: %s", aCmd)
         os.system(aCmd)
         duration = getDuration(pathWAV+".log")
-        logger.info(f"T={(time.time()-startTime)}")
-        logger.info(f"DURATION={str(duration)} subBeg={str(subBeg)} subEnd={str(subEnd)}")
-        logger.info(f"PATH={pathWAV}")
+        logger.debug("T=%s", (time.time()-startTime))
+        logger.debug("DURATION=%s subBeg=%s subEnd=%s", str(duration), str(subBeg), str(subEnd))
+        logger.debug("PATH=%s", pathWAV)
         pathIn = pathClean = pathWAV
     except Exception as e:
          logger.error("Warning: can't convert to WAV")
@@ -271,10 +285,10 @@ def transcribeOpts(path: str, opts: dict, lngInput=None, lng=None, isMusic=False
             #aCmd = "soundstretch \""+pathIn+"\""+" \""+pathSTRETCH+"\" -tempo="+str(int(100*float(stretch)) - 100)+" > \""+pathSTRETCH+".log\" 2>&1"
             #rubberband STRECH
             #aCmd = "rubberband \""+pathIn+"\""+" \""+pathSTRETCH+"\" --tempo "+stretch+" > \""+pathSTRETCH+".log\" 2>&1"
-            logger.info(f"CMD: {aCmd}")
+            logger.debug("CMD: %s", aCmd)
             os.system(aCmd)
-            logger.info(f"T={(time.time()-startTime)}")
-            logger.info(f"PATH={pathWAV}")
+            logger.debug("T=%s", (time.time()-startTime))
+            logger.debug("PATH=%s", pathWAV)
             pathIn = pathClean = pathWAV = pathSTRETCH
     except Exception as e:
          logger.error("Warning: can't STRETCH")
@@ -283,12 +297,16 @@ def transcribeOpts(path: str, opts: dict, lngInput=None, lng=None, isMusic=False
     startTime = time.time()
     try:
         #Check for duration
-        aCmd = "ffmpeg -y -i \""+pathIn+"\" "+ " -f null - > \""+pathIn+".dur\" 2>&1"
-        logger.info(f"CMD: {aCmd}")
-        os.system(aCmd)
-        logger.info(f"T={(time.time()-startTime)}")
-        duration = getDuration(pathIn+".dur")
-        logger.info(f"DURATION={str(duration)} max {str(maxDuration)}")
+        duration = getWavDuration(pathIn)
+        if(duration is None):
+            duration = getProbeDuration(pathIn)
+        if(duration is None):
+            aCmd = "ffmpeg -y -i \""+pathIn+"\" "+ " -f null - > \""+pathIn+".dur\" 2>&1"
+            logger.debug("CMD: %s", aCmd)
+            os.system(aCmd)
+            duration = getDuration(pathIn+".dur")
+        logger.debug("T=%s", (time.time()-startTime))
+        logger.debug("DURATION=%s max %s", str(duration), str(maxDuration))
         if(duration > maxDuration):
             return "[Too long ("+str(duration)+"s)]"
     except Exception as e:
@@ -303,8 +321,8 @@ def transcribeOpts(path: str, opts: dict, lngInput=None, lng=None, isMusic=False
                 os.mkdir(spleeterDir)
             pathSpleeter=spleeterDir+"/"+os.path.splitext(os.path.basename(pathIn))[0]+"/vocals.wav"
             separator.separate_to_file(pathIn, spleeterDir)
-            logger.info(f"T={(time.time()-startTime)}")
-            logger.info(f"PATH={pathSpleeter}")
+            logger.debug("T=%s", (time.time()-startTime))
+            logger.debug("PATH=%s", pathSpleeter)
             pathNoCut = pathIn = pathSpleeter
     except Exception as e:
          logger.error("Warning: can't split vocals")
@@ -325,8 +343,8 @@ def transcribeOpts(path: str, opts: dict, lngInput=None, lng=None, isMusic=False
             #print("CMD: "+aCmd)
             #os.system(aCmd)
             demucs_audio(pathIn=pathIn,model=modelDemucs,device="cuda:"+cudaIdx,pathVocals=pathDemucsVocals,pathOther=pathIn+".other.wav")
-            logger.info(f"T={(time.time()-startTime)}")
-            logger.info(f"PATH={pathDemucsVocals}")
+            logger.debug("T=%s", (time.time()-startTime))
+            logger.debug("PATH=%s", pathDemucsVocals)
             pathNoCut = pathIn = pathDemucsVocals
         except Exception as e:
              logger.error("Warning: can't split vocals")
@@ -336,10 +354,10 @@ def transcribeOpts(path: str, opts: dict, lngInput=None, lng=None, isMusic=False
     try:
         pathSILCUT = pathIn+".SILCUT"+".wav"
         aCmd = "ffmpeg -y -i \""+pathIn+"\" -af \"silenceremove=start_periods=1:stop_periods=-1:start_threshold=-50dB:stop_threshold=-50dB:start_silence=0.2:stop_silence=0.2, loudnorm\" "+ " -c:a pcm_s16le -ar "+str(SAMPLING_RATE)+" \""+pathSILCUT+"\" > \""+pathSILCUT+".log\" 2>&1"
-        logger.info(f"CMD: {aCmd}")
+        logger.debug("CMD: %s", aCmd)
         os.system(aCmd)
-        logger.info(f"T={(time.time()-startTime)}")
-        logger.info(f"PATH={pathSILCUT}")
+        logger.debug("T=%s", (time.time()-startTime))
+        logger.debug("PATH=%s", pathSILCUT)
         pathIn = pathSILCUT
     except Exception as e:
          logger.error("Warning: can't filter blanks")
@@ -354,8 +372,8 @@ def transcribeOpts(path: str, opts: dict, lngInput=None, lng=None, isMusic=False
             #https://github.com/snakers4/silero-vad/blob/master/utils_vad.py#L161
             speech_timestamps = get_speech_timestamps(wav, modelVAD,threshold=0.5,min_silence_duration_ms=500, sampling_rate=SAMPLING_RATE)
             save_audio(pathVAD,collect_chunks(speech_timestamps, wav), sampling_rate=SAMPLING_RATE)
-            logger.info(f"T={(time.time()-startTime)}")
-            logger.info(f"PATH={pathVAD}")
+            logger.debug("T=%s", (time.time()-startTime))
+            logger.debug("PATH=%s", pathVAD)
             pathIn = pathVAD
     except Exception as e:
          logger.error("Warning: can't filter noises")
@@ -375,10 +393,10 @@ def transcribeOpts(path: str, opts: dict, lngInput=None, lng=None, isMusic=False
                         #+ " -filter:a loudnorm"
                         +" -af \"speechnorm=e=50:r=0.0005:l=1\""
                         +" \""+pathNORM+"\" > \""+pathNORM+".log\" 2>&1")
-                logger.info(f"CMD: {aCmd}")
+                logger.debug("CMD: %s", aCmd)
                 os.system(aCmd)
-                logger.info(f"T={(time.time()-startTime)}")
-                logger.info(f"PATH={pathNORM}")
+                logger.debug("T=%s", (time.time()-startTime))
+                logger.debug("PATH=%s", pathNORM)
             else:
                 pathNORM = pathDemucsVocals
 
@@ -386,10 +404,10 @@ def transcribeOpts(path: str, opts: dict, lngInput=None, lng=None, isMusic=False
             aCmd = ("ffmpeg -y -i \""+pathNORM+"\" -i \""+pathDemucsDrums+"\" -i \""+pathDemucsBass+"\" -i \""+pathDemucsOther+"\""
                     +" -filter_complex amix=inputs=4:duration=longest:dropout_transition=0:weights=\"1 "+remixFactor+" "+remixFactor+" "+remixFactor+"\""
                     +" \""+pathREMIXN+"\" > \""+pathREMIXN+".log\" 2>&1")
-            logger.info(f"CMD: {aCmd}")
+            logger.debug("CMD: %s", aCmd)
             os.system(aCmd)
-            logger.info(f"T={(time.time()-startTime)}")
-            logger.info(f"PATH={pathREMIXN}")
+            logger.debug("T=%s", (time.time()-startTime))
+            logger.debug("PATH=%s", pathREMIXN)
     except Exception as e:
          logger.error("Warning: can't remix")
          logger.error(str(e))
@@ -502,13 +520,13 @@ def transcribeOpts(path: str, opts: dict, lngInput=None, lng=None, isMusic=False
 
     logger.info(f"T={(time.time()-initTime)}")
     if(len(result["text"]) > 0):
-        logger.info(f"s/c={(time.time()-initTime)/len(result['text'])}")
-    logger.info(f"c/s={len(result['text'])/(time.time()-initTime)}")
+        logger.debug("s/c=%s", (time.time()-initTime)/len(result['text']))
+    logger.debug("c/s=%s", len(result['text'])/(time.time()-initTime))
     
     return json.dumps(result)
 
 def transcribeMARK(path: str, opts: dict, mode=1, lngInput=None, aLast=None, isMusic=False, nbRun=1, max_line_width=80, max_line_count=2):
-    logger.info(f"transcribeMARK(): {path}")
+    logger.debug("transcribeMARK(): %s", path)
     pathIn = path
     
     lng = opts["language"]
@@ -544,17 +562,17 @@ def transcribeMARK(path: str, opts: dict, mode=1, lngInput=None, aLast=None, isM
         mark2 = mark
         
     if(mode == 0):
-        logger.info(f"[{mode}] PATH={pathIn}")
+        logger.debug("[%s] PATH=%s", mode, pathIn)
     else:
         try:
             if(mode != 3):
                 startTime = time.time()
                 pathMRK = pathIn+".MRK"+".wav"
                 aCmd = "ffmpeg -y -i "+mark1+" -i \""+pathIn+"\" -i "+mark2+" -filter_complex \"[0:a][1:a][2:a]concat=n=3:v=0:a=1[a]\" -map \"[a]\" -c:a pcm_s16le -ar "+str(SAMPLING_RATE)+" \""+pathMRK+"\" > \""+pathMRK+".log\" 2>&1"
-                logger.info(f"CMD: {aCmd}")
+                logger.debug("CMD: %s", aCmd)
                 os.system(aCmd)
-                logger.info(f"T={(time.time()-startTime)}")
-                logger.info(f"[{mode}] PATH={pathMRK}")
+                logger.debug("T=%s", (time.time()-startTime))
+                logger.debug("[%s] PATH=%s", mode, pathMRK)
                 pathIn = pathMRK
             
             if(useCompressor
@@ -563,10 +581,10 @@ def transcribeMARK(path: str, opts: dict, mode=1, lngInput=None, aLast=None, isM
                 startTime = time.time()
                 pathCPS = pathIn+".CPS"+".wav"
                 aCmd = "ffmpeg -y -i \""+pathIn+"\" -af \"speechnorm=e=50:r=0.0005:l=1\" "+ " -c:a pcm_s16le -ar "+str(SAMPLING_RATE)+" \""+pathCPS+"\" > \""+pathCPS+".log\" 2>&1"
-                logger.info(f"CMD: {aCmd}")
+                logger.debug("CMD: %s", aCmd)
                 os.system(aCmd)
-                logger.info(f"T={(time.time()-startTime)}")
-                logger.info(f"[{mode}] PATH={pathCPS}")
+                logger.debug("T=%s", (time.time()-startTime))
+                logger.debug("[%s] PATH=%s", mode, pathCPS)
                 pathIn = pathCPS
         except Exception as e:
              logger.error("Warning: can't add markers")
@@ -611,9 +629,9 @@ def transcribeMARK(path: str, opts: dict, mode=1, lngInput=None, aLast=None, isM
         # elif whisperFound == "FSTR":
         if whisperFound == "FSTR":
             result = {"text": "", "srt": "", "json": []}
-            multiRes = ""
+            runTexts = []
             for r in range(nbRun):
-                logger.info(f"RUN: {r}")
+                logger.debug("RUN: %s", r)
                 segments, info = model.transcribe(pathIn,**transcribe_options)
                 resSegs = []
                 json_segments = []
@@ -659,12 +677,10 @@ def transcribeMARK(path: str, opts: dict, mode=1, lngInput=None, aLast=None, isM
                 result["text"] += "".join(resSegs)
                 result["srt"] += "".join(resSegs) if mode == 3 else ""
                 result["json"].extend(json_segments)
-                if(r > 0):
-                    multiRes += "=====\n"
-                multiRes += result["text"]
+                runTexts.append(result["text"])
             
             if(nbRun > 1):
-                result["text"] = multiRes
+                result["text"] = "=====\n".join(runTexts)
         elif whisperFound == "SM4T":
             src_lang = lang2to3[lngInput];
             tgt_lang = lang2to3[lng];
@@ -678,10 +694,10 @@ def transcribeMARK(path: str, opts: dict, mode=1, lngInput=None, aLast=None, isM
             }
         else:
             transcribe_options = dict(task="transcribe", **transcribe_options)
-            multiRes = ""
+            runTexts = []
             result = {"text": "", "srt": "", "json": []}
             for r in range(nbRun):
-                logger.info(f"RUN: {r}")
+                logger.debug("RUN: %s", r)
                 whisper_result = model.transcribe(pathIn, **transcribe_options)
                 if(mode == 3):
                     srt_segments = []
@@ -701,15 +717,13 @@ def transcribeMARK(path: str, opts: dict, mode=1, lngInput=None, aLast=None, isM
                     }
                     result["json"].append(json_segment)
                 
-                if(r > 0):
-                    multiRes += "=====\n"
-                multiRes += result["text"]
+                runTexts.append(result["text"])
             
             if(nbRun > 1):
-                result["text"] = multiRes
+                result["text"] = "=====\n".join(runTexts)
         
-        logger.info(f"T={(time.time()-startTime)}")
-        logger.info(f"TRANS={result['text']}")
+        logger.debug("T=%s", (time.time()-startTime))
+        logger.debug("TRANS=%s", result['text'])
     except Exception as e: 
         logger.error(str(e))
         traceback.print_exc()
@@ -763,6 +777,13 @@ def transcribeMARK(path: str, opts: dict, mode=1, lngInput=None, aLast=None, isM
         return transcribeMARK(path, opts, mode=0,lngInput=lngInput,aLast=aCleaned)
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+#One session for every Gladia call, so upload, transcribe and polling reuse the same TLS connection
+GLADIA_SESSION = requests.Session()
+GLADIA_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504], allowed_methods=["GET"])))
+
 def transcribe_with_gladia(audio_path, source_lang, target_lang):
     upload_url = "https://api.gladia.io/v2/upload"
     transcribe_url = "https://api.gladia.io/v2/pre-recorded"
@@ -782,7 +803,7 @@ def transcribe_with_gladia(audio_path, source_lang, target_lang):
         with open(audio_path, "rb") as audio_file:
             logger.info(f"Uploading file to Gladia: {audio_path}")
             files = {"audio": (os.path.basename(audio_path), audio_file, "audio/mpeg")}
-            upload_response = requests.post(upload_url, files=files, headers=headers)
+            upload_response = GLADIA_SESSION.post(upload_url, files=files, headers=headers)
         
         if upload_response.status_code != 200:
             logger.error(f"Error uploading file: {upload_response.status_code}")
@@ -815,7 +836,7 @@ def transcribe_with_gladia(audio_path, source_lang, target_lang):
             },
         }
 
-        transcribe_response = requests.post(transcribe_url, json=payload, headers=transcribe_headers)
+        transcribe_response = GLADIA_SESSION.post(transcribe_url, json=payload, headers=transcribe_headers)
         if transcribe_response.status_code == 200 or transcribe_response.status_code == 201:
             transcribe_result = transcribe_response.json()
             result_url = transcribe_result["result_url"]
@@ -832,7 +853,7 @@ def transcribe_with_gladia(audio_path, source_lang, target_lang):
             fib = fibonacci()
 
             while total_wait_time < max_wait_time:
-                result_response = requests.get(result_url, headers=headers)
+                result_response = GLADIA_SESSION.get(result_url, headers=headers)
                 
                 if result_response.status_code == 200 or result_response.status_code == 201:
                     gladia_result = result_response.json()
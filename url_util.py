@@ -0,0 +1,65 @@
+import ipaddress
+import socket
+import requests
+from urllib.parse import urljoin, urlparse
+from fastapi import HTTPException
+
+# Content types accepted for audio inputs, video containers carry an audio track too
+AUDIO_CONTENT_TYPES = ("audio/", "video/", "application/octet-stream")
+# Redirects followed by check_audio_url before giving up on a URL
+MAX_REDIRECTS = 5
+
+def is_url(source):
+    return urlparse(source).scheme in ("http", "https")
+
+def audio_input_failed(stderr, url):
+    """Tell from ffmpeg's stderr whether it failed to read url, as opposed to failing on what it read"""
+    # ffmpeg prefixes errors opening an input with its URL, and network errors with the protocol
+    text = (stderr or b"").decode(errors="replace")
+    return url in text or any(f"[{protocol} @" in text for protocol in ("http", "https", "tls", "tcp"))
+
+def check_public_host(url):
+    """Reject URLs that aren't http(s) or whose host resolves to a private, loopback or other non-global address"""
+    parsed = urlparse(url)
+    if not is_url(url) or not parsed.hostname:
+        raise HTTPException(status_code=400, detail="Only http and https URLs are supported.")
+    try:
+        addresses = socket.getaddrinfo(parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80), proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Could not resolve host {parsed.hostname}.")
+    for address in addresses:
+        # Strip the zone index from scoped IPv6 addresses before parsing
+        if not ipaddress.ip_address(address[4][0].split("%")[0]).is_global:
+            raise HTTPException(status_code=400, detail=f"URL host {parsed.hostname} is not a public address.")
+
+def check_audio_url(session, url, max_bytes):
+    """Reject audio URLs we can't use before fetching them.
+
+    Redirects are followed by hand so every hop's host is checked, returns
+    the final URL, which is the one to fetch, and its HEAD response if the
+    origin gave one.
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        check_public_host(url)
+        try:
+            head = session.head(url, allow_redirects=False, timeout=3)
+        except requests.exceptions.RequestException:
+            return url, None
+        if not head.is_redirect:
+            break
+        url = urljoin(url, head.headers["Location"])
+    else:
+        raise HTTPException(status_code=400, detail=f"URL redirected more than {MAX_REDIRECTS} times.")
+    if not head.ok:
+        # Some origins refuse HEAD, let ffmpeg or the download report real errors
+        return url, None
+
+    content_length = head.headers.get("Content-Length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Audio file is larger than {max_bytes} bytes.")
+    content_type = head.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    if (content_type
+            and not content_type.startswith(AUDIO_CONTENT_TYPES)
+            and not urlparse(url).path.lower().endswith(".mp3")):
+        raise HTTPException(status_code=400, detail=f"URL does not point to an audio file (Content-Type: {content_type}).")
+    return url, head
@@ -1,10 +1,59 @@
 import litserve as ls
 import os
 import tempfile
-from fastapi import Response, HTTPException
-import urllib.request
-import ffmpeg
+import shutil
+from fastapi import HTTPException
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import subprocess
+from url_util import is_url, check_audio_url, audio_input_failed
+from output_util import new_output_path
 from starlette.middleware.cors import CORSMiddleware
+
+# Largest audio file accepted from audio_url
+MAX_AUDIO_BYTES = 200 * 1024 * 1024
+# Longest a single ffmpeg merge may take
+MERGE_TIMEOUT = 600
+# Longest a request may take: a merge that fails on the audio URL, the download, then a second merge
+REQUEST_TIMEOUT = 2 * MERGE_TIMEOUT + 300
+# Merge requests served at the same time, each runs one ffmpeg process
+MERGE_WORKERS = min(4, os.cpu_count() or 1)
+
+# Pooled so audio downloads from the same host reuse keep-alive connections
+DOWNLOAD_SESSION = requests.Session()
+_download_adapter = HTTPAdapter(pool_connections=20, pool_maxsize=100, max_retries=Retry(total=3, backoff_factor=0.3))
+DOWNLOAD_SESSION.mount("https://", _download_adapter)
+DOWNLOAD_SESSION.mount("http://", _download_adapter)
+
+def download_to(url, file_obj):
+    # Stream in 1 MiB blocks instead of holding the whole file in memory
+    with DOWNLOAD_SESSION.get(url, stream=True, timeout=(3.05, 300), allow_redirects=False) as response:
+        response.raise_for_status()
+        if response.is_redirect:
+            # url is the final hop check_audio_url validated, a new redirect target hasn't been checked
+            raise requests.exceptions.HTTPError(f"Unexpected redirect to {response.headers['Location']}")
+        response.raw.decode_content = True
+        shutil.copyfileobj(response.raw, file_obj, length=1 << 20)
+
+def merge(video_path, audio_source, output_path):
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", video_path]
+    if is_url(audio_source):
+        # Let ffmpeg fetch the audio itself, retrying if the connection drops
+        command += ["-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5"]
+    command += [
+        "-i", audio_source,
+        "-map", "0", "-map", "1",
+        "-c:v", "copy",  # Copy video codec
+        "-c:a", "aac",   # Use AAC for audio
+        "-shortest",     # End the output when the shortest input stream ends
+        "-movflags", "+faststart",  # Put the moov atom first so players can start before the download ends
+        output_path
+    ]
+    subprocess.run(command, check=True, capture_output=True, timeout=MERGE_TIMEOUT)
+
 class VideoAudioMergeAPI(ls.LitAPI):
     def setup(self, device):
         # No specific setup needed for this server
@@ -20,56 +69,59 @@ class VideoAudioMergeAPI(ls.LitAPI):
         audio_url = request["audio_url"]
         if not audio_url:
             raise HTTPException(status_code=400, detail="No audio URL provided in the request.")
+        # Carry on with where audio_url ends up after redirects, the host every hop went to has been checked
+        audio_url, _ = check_audio_url(DOWNLOAD_SESSION, audio_url, MAX_AUDIO_BYTES)
 
-        # Create temporary files for video and audio
+        # Create a temporary file for the video, ffmpeg reads the audio from its URL
         video_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
-        audio_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
 
         try:
             # Save the uploaded video to a temporary file
-            video_temp.write(video_file.read())
+            shutil.copyfileobj(video_file, video_temp, length=1 << 20)
             video_temp.close()
             print(f"Saved video to {video_temp.name}")
-            # Download the audio file
-            urllib.request.urlretrieve(audio_url, audio_temp.name)
-            audio_temp.close()
-            print(f"Saved audio to {audio_temp.name}")
-            return video_temp.name, audio_temp.name
+            return video_temp.name, audio_url
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Error processing files: {str(e)}")
 
     def predict(self, file_paths):
-        video_path, audio_path = file_paths
-        output_path = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4").name
+        video_path, audio_source = file_paths
+        output_path = new_output_path("merge_output_", ".mp4")
 
         try:
-            # Input video and audio streams
-            input_video = ffmpeg.input(video_path)
-            input_audio = ffmpeg.input(audio_path)
-
-            # Merge video and audio
-            output = ffmpeg.output(
-                input_video,
-                input_audio,
-                output_path,
-                vcodec='copy',  # Copy video codec
-                acodec='aac',   # Use AAC for audio
-                shortest=None   # End the output when the shortest input stream ends
-            )
-
-            # Run the FFmpeg command
-            ffmpeg.run(output, overwrite_output=True, capture_stdout=True, capture_stderr=True)
+            try:
+                merge(video_path, audio_source, output_path)
+            except subprocess.CalledProcessError as e:
+                # Only a failure to read the audio URL is worth a download, anything else (a bad video, a bad encode) won't be fixed by it
+                if not is_url(audio_source) or not audio_input_failed(e.stderr, audio_source):
+                    raise
+                # Some hosts don't play well with ffmpeg's HTTP client, download the audio and retry
+                print(f"ffmpeg could not read audio URL directly, downloading it instead: {e.stderr.decode()}")
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as audio_temp:
+                    try:
+                        download_to(audio_source, audio_temp)
+                    except Exception as download_error:
+                        os.unlink(audio_temp.name)
+                        raise HTTPException(status_code=400, detail=f"Error downloading audio: {str(download_error)}")
+                try:
+                    merge(video_path, audio_temp.name, output_path)
+                finally:
+                    os.unlink(audio_temp.name)
 
             print("FFmpeg process completed successfully")
 
             # Clean up temporary files
             os.unlink(video_path)
-            os.unlink(audio_path)
+            if not is_url(audio_source):
+                os.unlink(audio_source)
             print(f"Unlinked temporary files")
             print(f"Returning output path: {output_path}")
             return output_path
 
-        except ffmpeg.Error as e:
+        except HTTPException:
+            raise
+
+        except subprocess.CalledProcessError as e:
             # FFmpeg error occurred
             print(f"FFmpeg error: {e.stderr.decode()}")
             raise HTTPException(status_code=500, detail=f"FFmpeg error: {e.stderr.decode()}")
@@ -82,13 +134,10 @@ class VideoAudioMergeAPI(ls.LitAPI):
     def encode_response(self, output_path):
         try:
             print(f"Encoding response with output path: {output_path}")
-            # Read the content of the merged file
-            with open(output_path, "rb") as f:
-                content = f.read()
-            # Remove the temporary merged file
-            os.remove(output_path)
-            # Return the response with the correct media type
-            return Response(content=content, media_type="video/mp4")
+            if not os.path.exists(output_path):
+                raise FileNotFoundError(f"No such file: {output_path}")
+            # Send the merged file straight from disk and remove it once it has been sent
+            return FileResponse(output_path, media_type="video/mp4", background=BackgroundTask(os.remove, output_path))
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error encoding response: {str(e)}")
 
@@ -103,6 +152,9 @@ if __name__ == "__main__":
             "allow_headers": ["*"],  # Allows all headers
         }
     )
-    server = ls.LitServer(VideoAudioMergeAPI(), middlewares=[cors_middleware])
+    # Merging is a stream copy plus an AAC encode, mostly waiting on uploads and the audio URL,
+    # so a few workers on one CPU device keep one slow request from holding up the rest.
+    # accelerator "auto" would start MERGE_WORKERS workers per GPU instead
+    server = ls.LitServer(VideoAudioMergeAPI(), accelerator="cpu", devices=1, workers_per_device=MERGE_WORKERS, timeout=REQUEST_TIMEOUT, middlewares=[cors_middleware])
     
     server.run(port=8887)
@@ -1,13 +1,18 @@
 import litserve as ls
 import os
 import tempfile
+import shutil
+import subprocess
 from fastapi import Response, HTTPException
-from pydub import AudioSegment
+import ffmpeg
 import torch
 from transcribeHallu import loadModel, transcribePrompt
-import json
+from url_util import is_url, check_audio_url, audio_input_failed
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
+from collections import OrderedDict
 from datetime import datetime
 
 # Set up logging
@@ -24,13 +29,117 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Number of URL transcriptions kept in memory per worker
+TRANSCRIPTION_CACHE_SIZE = 256
+# Largest audio file accepted from a URL
+MAX_AUDIO_BYTES = 100 * 1024 * 1024
+# RAM-backed scratch space, used while it has at least MIN_SHM_FREE_BYTES free
+SHM_DIR = "/dev/shm"
+MIN_SHM_FREE_BYTES = 2 * 1024 * 1024 * 1024
+# Longest a single ffmpeg decode to WAV may take
+CONVERT_TIMEOUT = 300
+# Longest ffmpeg waits on a stalled URL read, matching the download fallback's read timeout
+URL_READ_TIMEOUT = 60
+
+def scratch_dir():
+    """Return where a request's scratch files go, /dev/shm when it has room, else the default temp dir"""
+    try:
+        if shutil.disk_usage(SHM_DIR).free >= MIN_SHM_FREE_BYTES:
+            return SHM_DIR
+    except OSError:
+        pass
+    return None
+
+def convert_to_wav(source, audio_file=None):
+    """Decode source to a WAV file in a fresh temporary directory, returns the WAV's path and the directory.
+
+    source is a path or URL ffmpeg can open, or "pipe:0" to read audio_file
+    through ffmpeg's stdin so the input never has to be written to disk.
+    transcribePrompt writes its intermediate files next to the WAV, so the
+    caller removes the whole directory with remove_work_dir(work_dir) once done.
+    """
+    work_dir = tempfile.mkdtemp(prefix="whisperhallu_", dir=scratch_dir())
+    wav_path = os.path.join(work_dir, "input.wav")
+    log_path = os.path.join(work_dir, "convert.log")
+    input_args = {}
+    if is_url(source):
+        # Retry dropped connections, and give up on an origin that stops sending for URL_READ_TIMEOUT seconds
+        input_args = dict(reconnect=1, reconnect_streamed=1, reconnect_delay_max=5, rw_timeout=URL_READ_TIMEOUT * 1000000)
+    args = (
+        ffmpeg
+        .input(source, **input_args)
+        .output(wav_path, acodec="pcm_s16le")
+        .global_args("-loglevel", "error")
+        .overwrite_output()
+        .compile()
+    )
+    # stderr goes to a file: a pipe nobody reads while stdin is being fed
+    # fills up on a corrupt input, and ffmpeg then stops reading stdin
+    process = None
+    try:
+        with open(log_path, "wb") as log_file:
+            process = subprocess.Popen(args, stdin=subprocess.PIPE if audio_file is not None else subprocess.DEVNULL, stderr=log_file)
+        if audio_file is not None:
+            try:
+                shutil.copyfileobj(audio_file, process.stdin, length=1 << 20)
+            except BrokenPipeError:
+                # ffmpeg gave up on the input, its log says why
+                pass
+        process.communicate(timeout=CONVERT_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+        remove_work_dir(work_dir)
+        raise ffmpeg.Error("ffmpeg", None, f"ffmpeg did not finish within {CONVERT_TIMEOUT} seconds".encode())
+    except Exception as e:
+        if process is not None:
+            process.kill()
+            process.wait()
+        remove_work_dir(work_dir)
+        if process is None and isinstance(e, OSError):
+            # ffmpeg is missing or couldn't be started, report it like any other ffmpeg failure
+            raise ffmpeg.Error("ffmpeg", None, f"Could not run ffmpeg: {e}".encode()) from e
+        raise
+    if process.returncode != 0:
+        with open(log_path, "rb") as log_file:
+            stderr = log_file.read()
+        remove_work_dir(work_dir)
+        raise ffmpeg.Error("ffmpeg", None, stderr)
+    return wav_path, work_dir
+
+def remove_work_dir(work_dir):
+    """Remove a directory made by convert_to_wav and everything in it"""
+    shutil.rmtree(work_dir, ignore_errors=True)
+
 class WhisperHalluAPI(ls.LitAPI):
     def setup(self, device):
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        logger.info(f"Using device: {self.device}")
+        logger.info("Using device: %s", self.device)
         self.model_size = "medium"
         loadModel("0", modelSize=self.model_size)
-        logger.info(f"Model loaded successfully: {self.model_size}")
+        logger.info("Model loaded successfully: %s", self.model_size)
+
+        # One pooled session per worker so URL downloads reuse keep-alive connections
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=64,
+            max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # Transcriptions of URL inputs, keyed by (url, ETag/Last-Modified, input language)
+        self.transcription_cache = OrderedDict()
+
+    def _cache_key(self, url, head, lng_input):
+        # Only cache when the origin gives us a validator, so a changed file is transcribed again
+        if head is None:
+            return None
+        validator = head.headers.get("ETag") or head.headers.get("Last-Modified")
+        if not validator:
+            return None
+        return (url, validator, lng_input)
 
     def decode_request(self, request):
         try:
@@ -41,30 +150,39 @@ class WhisperHalluAPI(ls.LitAPI):
             lng = request.get("lng", "en")
             lng_input = request.get("lng_input", "en")
 
-            logger.info(f"Request received - URL: {url if url else 'None'}, Language: {lng}, Input Language: {lng_input}")
+            logger.debug("Request received - URL: %s, Language: %s, Input Language: %s", url, lng, lng_input)
 
             if url:
-                # If URL is provided, download the file
+                # source_url is where url ends up after redirects, the host every hop went to has been checked
+                source_url, head = check_audio_url(self.session, url, MAX_AUDIO_BYTES)
+                cache_key = self._cache_key(url, head, lng_input)
+                if cache_key in self.transcription_cache:
+                    logger.debug("Transcription cache hit for URL: %s", url)
+                    self.transcription_cache.move_to_end(cache_key)
+                    return {"cached": self.transcription_cache[cache_key]}
+
+                # Let ffmpeg read the URL itself and decode straight to WAV,
+                # skipping the MP3 download and the pydub round-trip
+                try:
+                    wav_path, work_dir = convert_to_wav(source_url)
+                    return {"file_path": wav_path, "work_dir": work_dir, "lng": lng, "lng_input": lng_input, "cache_key": cache_key}
+                except ffmpeg.Error as e:
+                    # Only a failure to read the URL is worth a download, a file ffmpeg can't decode
+                    # or a decode that ran out of time won't go any better from a pipe
+                    if not audio_input_failed(e.stderr, source_url):
+                        raise HTTPException(status_code=400, detail=f"Error processing file from URL: {e.stderr.decode(errors='replace')}")
+                    logger.warning("ffmpeg could not read URL directly, downloading it instead: %s", e.stderr.decode(errors='replace'))
+
+                # Fall back to downloading the file, piping it into ffmpeg as it arrives
                 try:
-                    response = requests.get(url)
-                    response.raise_for_status()
-                    
-                    # Create a temporary file with a .mp3 extension
-                    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-                    
-                    # Write the downloaded content to the temporary file
-                    with open(temp_file.name, "wb") as f:
-                        f.write(response.content)
-                    
-                    # Convert MP3 to WAV
-                    audio = AudioSegment.from_mp3(temp_file.name)
-                    wav_file = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-                    audio.export(wav_file.name, format="wav")
-                    
-                    # Clean up the temporary MP3 file
-                    os.unlink(temp_file.name)
-                    
-                    return {"file_path": wav_file.name, "lng": lng, "lng_input": lng_input}
+                    with self.session.get(source_url, timeout=(3.05, URL_READ_TIMEOUT), stream=True, allow_redirects=False) as response:
+                        response.raise_for_status()
+                        if response.is_redirect:
+                            # A new redirect target hasn't been checked, don't follow it
+                            raise requests.exceptions.HTTPError(f"Unexpected redirect to {response.headers['Location']}")
+                        response.raw.decode_content = True
+                        wav_path, work_dir = convert_to_wav("pipe:0", response.raw)
+                    return {"file_path": wav_path, "work_dir": work_dir, "lng": lng, "lng_input": lng_input, "cache_key": cache_key}
                 except Exception as e:
                     raise HTTPException(status_code=400, detail=f"Error downloading or processing file from URL: {str(e)}")
 
@@ -73,35 +191,23 @@ class WhisperHalluAPI(ls.LitAPI):
             if audio_file is None:
                 raise HTTPException(status_code=400, detail="No audio file or URL found in the request.")
 
-            # Create a temporary file with a .mp3 extension
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-            
-            # Read the file content
-            audio_data = audio_file.read()
-            
-            # Write the audio data to the temporary file
-            with open(temp_file.name, "wb") as f:
-                f.write(audio_data)
-            
-            # Convert MP3 to WAV
+            # Pipe the upload into ffmpeg instead of copying it to a temporary MP3 first
             try:
-                audio = AudioSegment.from_mp3(temp_file.name)
-                wav_file = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-                audio.export(wav_file.name, format="wav")
-                
-                # Clean up the temporary MP3 file
-                os.unlink(temp_file.name)
-                print("wav_file.name: ", wav_file.name)
-                return {"file_path": wav_file.name, "lng": lng, "lng_input": lng_input}
-            except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Error processing audio file: {str(e)}")
+                wav_path, work_dir = convert_to_wav("pipe:0", audio_file)
+                logger.debug("wav_file.name: %s", wav_path)
+                return {"file_path": wav_path, "work_dir": work_dir, "lng": lng, "lng_input": lng_input}
+            except ffmpeg.Error as e:
+                raise HTTPException(status_code=400, detail=f"Error processing audio file: {e.stderr.decode(errors='replace')}")
         except Exception as e:
-            logger.error(f"Error in decode_request: {str(e)}")
+            logger.error("Error in decode_request: %s", e)
             raise
 
     def predict(self, request_data):
+        if "cached" in request_data:
+            return request_data["cached"]
+
         try:
-            logger.info(f"Starting transcription for file: {request_data['file_path']}")
+            logger.debug("Starting transcription for file: %s", request_data["file_path"])
             file_path = request_data["file_path"]
             
             lng_input = request_data.get("lng_input", "en")
@@ -115,22 +221,31 @@ class WhisperHalluAPI(ls.LitAPI):
             # Perform transcription
             result = transcribePrompt(path=file_path, addSRT=True, lng=lng, prompt=prompt, lngInput=lng_input, isMusic=isMusic)
 
-            logger.info("Transcription completed successfully")
+            if result.startswith("[Too long"):
+                # transcribeOpts reports over-long audio as plain text instead of JSON
+                raise HTTPException(status_code=413, detail=f"Audio is too long to transcribe: {result}")
+
+            logger.debug("Transcription completed successfully")
+
+            cache_key = request_data.get("cache_key")
+            if cache_key is not None:
+                self.transcription_cache[cache_key] = result
+                if len(self.transcription_cache) > TRANSCRIPTION_CACHE_SIZE:
+                    self.transcription_cache.popitem(last=False)
             return result
         except Exception as e:
-            logger.error(f"Error in predict: {str(e)}")
+            logger.error("Error in predict: %s", e)
             raise
+        finally:
+            remove_work_dir(request_data["work_dir"])
 
     def encode_response(self, transcription):
         try:
-            logger.info("Encoding response")
-            # Parse the JSON string returned by transcribePrompt
-            transcription_data = json.loads(transcription)
-            
-            # Return the transcription as JSON
-            return Response(content=json.dumps(transcription_data), media_type="application/json")
+            logger.debug("Encoding response")
+            # transcribePrompt already returns a JSON string, send it as-is
+            return Response(content=transcription, media_type="application/json")
         except Exception as e:
-            logger.error(f"Error in encode_response: {str(e)}")
+            logger.error("Error in encode_response: %s", e)
             raise
 
 # Run the LitServe server
@@ -141,5 +256,5 @@ if __name__ == "__main__":
         logger.info("Server initialized, starting on port 8889")
         server.run(port=8889)
     except Exception as e:
-        logger.error(f"Server failed to start: {str(e)}")
+        logger.error("Server failed to start: %s", e)
         raise